@@ -0,0 +1,125 @@
+"""
+Benchmark upgrading a large pre-versioning database.
+
+Builds a synthetic database with the original unversioned schema, then times
+opening it with Db (the tracker's boot path) and finishing the remaining
+backfills one resumable step at a time. Exits with an error if boot takes
+longer than --max-boot seconds, a single step takes longer than --max-step
+seconds, or the backfilled tables do not match the session history.
+
+    python benchmarks/bench_migrations.py --rows 2000000
+    python benchmarks/bench_migrations.py --rows 1000000 --users 1
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from go_touch_grass.database import Db, DEFAULT_BACKFILL_BUDGET
+from go_touch_grass.migrations import MIGRATIONS
+
+
+def build_database(db_path: Path, rows: int, users: int) -> None:
+    """Create an unversioned database holding rows synthetic sessions."""
+    rng = random.Random(0)
+    start = 1.6e9
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(MIGRATIONS[0][2][0])
+        batch = []
+        for i in range(rows):
+            duration = rng.uniform(60, 12 * 3600)
+            session_type = 'offline' if (i // users) % 2 else 'online'
+            batch.append((f"user{i % users}", start, start + duration, duration, session_type))
+            start += duration / users
+            if len(batch) == 100_000:
+                conn.executemany('''
+                    INSERT INTO sessions (username, start_time, end_time, duration, type)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', batch)
+                batch = []
+        conn.executemany('''
+            INSERT INTO sessions (username, start_time, end_time, duration, type)
+            VALUES (?, ?, ?, ?, ?)
+        ''', batch)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark schema migrations on a synthetic database.')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Number of sessions (default: 1000000)')
+    parser.add_argument('--users', type=int, default=1000, help='Number of users (default: 1000)')
+    parser.add_argument('--max-boot', type=float, default=10.0, help='Allowed boot time in seconds (default: 10)')
+    parser.add_argument('--max-step', type=float, default=1.0,
+                        help='Allowed time for one backfill step in seconds (default: 1)')
+    parser.add_argument('--sample', type=int, default=20, help='Users whose streaks are verified (default: 20)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / 'bench.db'
+
+        started = time.perf_counter()
+        build_database(db_path, args.rows, args.users)
+        print(f"Built {args.rows} sessions for {args.users} users in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        db = Db(db_path)
+        boot = time.perf_counter() - started
+        print(f"Boot (schema migrations + {DEFAULT_BACKFILL_BUDGET}s backfill budget): {boot:.2f}s, "
+              f"pending: {', '.join(db.pending_backfills()) or 'none'}")
+
+        started = time.perf_counter()
+        steps = 0
+        longest_step = 0.0
+        done = not db.pending_backfills()
+        while not done:
+            step_started = time.perf_counter()
+            done = db.run_backfills(time_budget=0)
+            longest_step = max(longest_step, time.perf_counter() - step_started)
+            steps += 1
+        print(f"Remaining backfills: {time.perf_counter() - started:.2f}s over {steps} resumable steps, "
+              f"longest step {longest_step:.3f}s")
+
+        with sqlite3.connect(db_path) as conn:
+            expected = conn.execute('''
+                SELECT username, type, SUM(duration), MAX(duration), COUNT(*)
+                FROM sessions GROUP BY username, type ORDER BY username, type
+            ''').fetchall()
+            actual = conn.execute('''
+                SELECT username, type, total, longest, session_count
+                FROM user_totals ORDER BY username, type
+            ''').fetchall()
+            streak_users = conn.execute('SELECT COUNT(*) FROM streaks').fetchone()[0]
+            usernames = [row[0] for row in conn.execute('SELECT username FROM streaks ORDER BY username')]
+
+        # Compare a spread of backfilled streaks against a full replay.
+        sample = usernames[::max(1, len(usernames) // args.sample)][:args.sample]
+        backfilled = {username: db.get_streak(username) for username in sample}
+        for username in sample:
+            db.rebuild_streaks(username)
+        mismatched = [username for username in sample if db.get_streak(username) != backfilled[username]]
+
+        failures = []
+        if boot > args.max_boot:
+            failures.append(f"boot took {boot:.2f}s, more than {args.max_boot}s")
+        if longest_step > args.max_step:
+            failures.append(f"a backfill step took {longest_step:.2f}s, more than {args.max_step}s")
+        if len(expected) != len(actual) or any(
+            e[:2] != a[:2] or abs(e[2] - a[2]) > 1e-6 * e[2] or e[3:] != a[3:] for e, a in zip(expected, actual)
+        ):
+            failures.append("user_totals does not match the session history")
+        if streak_users != args.users:
+            failures.append(f"streaks has {streak_users} users, expected {args.users}")
+        if mismatched:
+            failures.append(f"streaks differ from a full replay for: {', '.join(mismatched)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import date, datetime, timedelta, tzinfo
+from pathlib import Path
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without the extra installed
+    np = None
+
+from go_touch_grass.config import APP_CACHE_DIR, ensure_dirs_exist
+from go_touch_grass.database import Db
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_DIR: Path = APP_CACHE_DIR / 'sessions'
+
+# Column name -> numpy dtype string for the on-disk cache.
+COLUMNS: dict[str, str] = {
+    'id': '<i8',
+    'start': '<f8',
+    'end': '<f8',
+    'duration': '<f8',
+    'type': '<i1',
+    'user': '<i4',
+}
+SESSION_TYPES: tuple[str, ...] = ('online', 'offline')
+
+
+def local_days(start_time: float, end_time: float, tz: tzinfo | None = None) -> list[date]:
+    """Return every calendar day in tz, local time if None, from start_time to end_time."""
+    first = datetime.fromtimestamp(start_time, tz).date()
+    last = datetime.fromtimestamp(end_time, tz).date()
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def local_timestamp(day: date, hour: int = 0, tz: tzinfo | None = None) -> float:
+    """
+    Unix timestamp of a wall-clock hour in tz, local time if None.
+
+    An hour skipped by a DST change maps to the same instant as the next
+    hour, so its bucket is empty. A repeated hour falls into one bucket.
+    """
+    return datetime(day.year, day.month, day.day, hour, tzinfo=tz).timestamp()
+
+
+class SessionCache:
+    """
+    Columnar, memory-mapped snapshot of the sessions table.
+
+    Each column is stored as a flat binary file in cache_dir and mapped with
+    numpy.memmap. refresh() appends only rows with an id above the highest
+    one already cached, so keeping the snapshot current is cheap. The cache
+    remembers which database it was built from and is rebuilt if the database
+    changes or was recreated.
+    """
+
+    def __init__(self, db: Db | None = None, cache_dir: Path | str | None = None, chunk_size: int = 100_000) -> None:
+        if np is None:
+            raise ImportError("numpy is required for analytics, install with 'pip install go_touch_grass[analytics]'")
+
+        self.db: Db = db if db else Db()
+        self.db_key: str = str(Path(self.db.db_path).resolve())
+        default_dir = SESSION_CACHE_DIR / hashlib.sha1(self.db_key.encode()).hexdigest()[:16]
+        self.cache_dir: Path = Path(cache_dir) if cache_dir else default_dir
+        self.chunk_size: int = chunk_size
+        self.meta_file: Path = self.cache_dir / 'meta.json'
+
+        ensure_dirs_exist()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.meta: dict[str, Any] = self._load_meta()
+        self._columns: dict[str, Any] = {}
+
+    def _load_meta(self) -> dict[str, Any]:
+        """Load cache metadata, starting fresh if it is missing or unreadable."""
+        try:
+            if self.meta_file.exists():
+                with open(self.meta_file, 'r') as f:
+                    meta = json.load(f)
+                    if isinstance(meta, dict) and {'db_path', 'rows', 'last_id', 'last_start', 'users'} <= meta.keys():
+                        return meta
+        except Exception as e:
+            logger.error(f"Error loading session cache metadata: {e}")
+        return self._empty_meta()
+
+    def _empty_meta(self) -> dict[str, Any]:
+        return {'db_path': self.db_key, 'rows': 0, 'last_id': 0, 'last_start': None, 'users': []}
+
+    def _save_meta(self) -> None:
+        """Atomically write cache metadata."""
+        tmp_file = self.meta_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.meta, f)
+        tmp_file.replace(self.meta_file)
+
+    def _column_file(self, name: str) -> Path:
+        return self.cache_dir / f'{name}.bin'
+
+    def refresh(self) -> int:
+        """
+        Append sessions added since the last refresh to the cache.
+
+        Returns:
+            int: Number of new rows loaded
+        """
+        for name in COLUMNS:
+            self._column_file(name).touch()
+
+        added = 0
+        with sqlite3.connect(self.db.db_path) as conn:
+            cursor = conn.cursor()
+
+            # A column shorter than recorded means the cache is damaged, rebuild it.
+            if any(self._column_file(name).stat().st_size < self.meta['rows'] * np.dtype(dtype).itemsize
+                   for name, dtype in COLUMNS.items()):
+                logger.warning("Session cache is incomplete - rebuilding")
+                self.meta = self._empty_meta()
+
+            # The last cached row must still exist in the same database.
+            cursor.execute('SELECT start_time FROM sessions WHERE id = ?', (self.meta['last_id'],))
+            row = cursor.fetchone()
+            if self.meta['db_path'] != self.db_key or (
+                self.meta['last_id'] and (row is None or row[0] != self.meta['last_start'])
+            ):
+                logger.warning("Session cache does not match the database - rebuilding")
+                self.meta = self._empty_meta()
+
+            rows = self.meta['rows']
+            user_ids = {username: i for i, username in enumerate(self.meta['users'])}
+            self._columns = {}
+
+            # Drop any partial append left behind by an interrupted refresh.
+            for name, dtype in COLUMNS.items():
+                with open(self._column_file(name), 'r+b') as f:
+                    f.truncate(rows * np.dtype(dtype).itemsize)
+
+            cursor.execute('''
+                SELECT id, username, start_time, end_time, duration, type
+                FROM sessions
+                WHERE id > ?
+                ORDER BY id
+            ''', (self.meta['last_id'],))
+
+            while True:
+                chunk = cursor.fetchmany(self.chunk_size)
+                if not chunk:
+                    break
+
+                ids, usernames, starts, ends, durations, types = zip(*chunk)
+                for username in usernames:
+                    if username not in user_ids:
+                        user_ids[username] = len(user_ids)
+                        self.meta['users'].append(username)
+
+                arrays = {
+                    'id': np.array(ids, dtype=COLUMNS['id']),
+                    'start': np.array(starts, dtype=COLUMNS['start']),
+                    'end': np.array(ends, dtype=COLUMNS['end']),
+                    'duration': np.array(durations, dtype=COLUMNS['duration']),
+                    'type': np.array([SESSION_TYPES.index(t) for t in types], dtype=COLUMNS['type']),
+                    'user': np.array([user_ids[u] for u in usernames], dtype=COLUMNS['user']),
+                }
+                for name, array in arrays.items():
+                    with open(self._column_file(name), 'ab') as f:
+                        f.write(array.tobytes())
+
+                added += len(chunk)
+                self.meta['rows'] = rows + added
+                self.meta['last_id'] = int(ids[-1])
+                self.meta['last_start'] = starts[-1]
+                self._save_meta()
+
+        if added:
+            logger.info(f"Loaded {added} new sessions into the analytics cache")
+        return added
+
+    def column(self, name: str) -> Any:
+        """Return a read-only memory-mapped view of a cached column."""
+        if name not in self._columns:
+            rows = self.meta['rows']
+            if rows == 0:
+                self._columns[name] = np.empty(0, dtype=COLUMNS[name])
+            else:
+                self._columns[name] = np.memmap(self._column_file(name), dtype=COLUMNS[name], mode='r', shape=(rows,))
+        return self._columns[name]
+
+    def mask(self, session_type: str | None = 'offline', username: str | None = None) -> Any:
+        """Boolean mask selecting sessions of a type and, optionally, one user."""
+        selected = np.ones(self.meta['rows'], dtype=bool)
+        if session_type is not None:
+            selected &= self.column('type') == SESSION_TYPES.index(session_type)
+        if username is not None:
+            if username not in self.meta['users']:
+                return np.zeros(self.meta['rows'], dtype=bool)
+            selected &= self.column('user') == self.meta['users'].index(username)
+        return selected
+
+    def binned_totals(
+        self,
+        edges: Any,
+        session_type: str | None = 'offline',
+        username: str | None = None
+    ) -> Any:
+        """
+        Seconds of session time falling in each bin between consecutive edges.
+
+        Sessions spanning several bins are split between them. Uses the
+        cumulative coverage C(t) = sum(clip(t - start, 0, duration)), which
+        is evaluated for every edge at once from sorted starts and ends.
+
+        Args:
+            edges: Increasing Unix timestamps, n + 1 edges for n bins
+
+        Returns:
+            numpy.ndarray: Seconds per bin
+        """
+        edges = np.asarray(edges, dtype=np.float64)
+        selected = self.mask(session_type, username)
+        starts = np.sort(self.column('start')[selected])
+        ends = np.sort(self.column('end')[selected])
+
+        def coverage(sorted_times: Any) -> Any:
+            prefix = np.concatenate(([0.0], np.cumsum(sorted_times)))
+            count = np.searchsorted(sorted_times, edges, side='right')
+            return count * edges - prefix[count]
+
+        return np.diff(coverage(starts) - coverage(ends))
+
+    def _local_days(self, session_type: str | None, username: str | None, tz: tzinfo | None) -> list[date]:
+        """Local calendar days covering every selected session."""
+        selected = self.mask(session_type, username)
+        if not selected.any():
+            return []
+        return local_days(self.column('start')[selected].min(), self.column('end')[selected].max(), tz)
+
+    def hourly_totals(
+        self,
+        session_type: str | None = 'offline',
+        username: str | None = None,
+        tz: tzinfo | None = None
+    ) -> tuple[Any, Any]:
+        """
+        Seconds of session time per local clock hour over the whole history.
+
+        Hour boundaries are computed per day in tz, local time if None, so
+        they follow DST changes.
+
+        Returns:
+            tuple: (hour start timestamps, seconds per hour)
+        """
+        edges = [
+            local_timestamp(day, hour, tz)
+            for day in self._local_days(session_type, username, tz)
+            for hour in range(24)
+        ]
+        if not edges:
+            return np.empty(0), np.empty(0)
+        edges.append(local_timestamp(datetime.fromtimestamp(edges[-1], tz).date() + timedelta(days=1), 0, tz))
+        edges = np.array(edges)
+        return edges[:-1], self.binned_totals(edges, session_type, username)
+
+    def daily_totals(
+        self,
+        session_type: str | None = 'offline',
+        username: str | None = None,
+        tz: tzinfo | None = None
+    ) -> tuple[Any, Any]:
+        """
+        Seconds of session time per local calendar day in tz, local time if None.
+
+        Returns:
+            tuple: (numpy datetime64 days, seconds per day)
+        """
+        days = self._local_days(session_type, username, tz)
+        if not days:
+            return np.empty(0, dtype='datetime64[D]'), np.empty(0)
+        edges = [local_timestamp(day, 0, tz) for day in days]
+        edges.append(local_timestamp(days[-1] + timedelta(days=1), 0, tz))
+        return np.array(days, dtype='datetime64[D]'), self.binned_totals(edges, session_type, username)
+
+    def hour_of_day_histogram(
+        self,
+        session_type: str | None = 'offline',
+        username: str | None = None,
+        tz: tzinfo | None = None
+    ) -> Any:
+        """Total seconds spent in each of the 24 local clock hours."""
+        return self.time_of_day_heatmap(session_type, username, tz).sum(axis=0)
+
+    def time_of_day_heatmap(
+        self,
+        session_type: str | None = 'offline',
+        username: str | None = None,
+        tz: tzinfo | None = None
+    ) -> Any:
+        """
+        Total seconds per (weekday, hour) cell in tz, local time if None.
+
+        Returns:
+            numpy.ndarray: 7 x 24 array, row 0 is Monday
+        """
+        heatmap = np.zeros((7, 24), dtype=np.float64)
+        days = self._local_days(session_type, username, tz)
+        if not days:
+            return heatmap
+
+        _, totals = self.hourly_totals(session_type, username, tz)
+        weekdays = np.repeat([day.weekday() for day in days], 24)
+        hours = np.tile(np.arange(24), len(days))
+        np.add.at(heatmap, (weekdays, hours), totals)
+        return heatmap
+
+    def gap_analysis(self, username: str | None = None) -> dict[str, Any]:
+        """
+        Gaps between consecutive sessions of the same user, of any type.
+
+        Returns:
+            dict: count, total, mean, median and max gap in seconds, and the gaps array
+        """
+        selected = self.mask(None, username)
+        users = self.column('user')[selected]
+        starts = self.column('start')[selected]
+        ends = self.column('end')[selected]
+
+        order = np.lexsort((starts, users))
+        users, starts, ends = users[order], starts[order], ends[order]
+        same_user = users[1:] == users[:-1]
+        gaps = (starts[1:] - ends[:-1])[same_user]
+        gaps = gaps[gaps > 0]
+
+        if gaps.size == 0:
+            return {'count': 0, 'total': 0.0, 'mean': 0.0, 'median': 0.0, 'max': 0.0, 'gaps': gaps}
+        return {
+            'count': int(gaps.size),
+            'total': float(gaps.sum()),
+            'mean': float(gaps.mean()),
+            'median': float(np.median(gaps)),
+            'max': float(gaps.max()),
+            'gaps': gaps,
+        }
@@ -1,13 +1,80 @@
+from __future__ import annotations
+
 import argparse
+import time
+from go_touch_grass.database import Db, DEFAULT_STREAK_GOAL, LEADERBOARD_METRICS
 from go_touch_grass.tracker import TimeTracker
 from go_touch_grass.outputs.discord import DiscordOutput
 from go_touch_grass.outputs.file import FileOutput
 from go_touch_grass.outputs.console import ConsoleOutput
 
 
+def print_leaderboard(metric: str, session_type: str, limit: int, days: int | None, streak_goal: float) -> None:
+    """Print the top users for a metric to stdout."""
+    since = time.time() - days * 86400 if days else None
+    db = Db(streak_goal=streak_goal)
+    if metric == 'streak' and 'streaks' in db.pending_backfills():
+        print("Finishing the streaks database upgrade first...")
+        db.run_backfills()
+    leaderboard = db.get_leaderboard(metric=metric, session_type=session_type, limit=limit, since=since)
+
+    window = f"last {days} day{'s' if days != 1 else ''}" if days else "all time"
+    if metric == 'streak':
+        print(f"Leaderboard: longest streak ({window})")
+    else:
+        print(f"Leaderboard: {metric} {session_type} time ({window})")
+    if not leaderboard:
+        print("No sessions recorded.")
+    for entry in leaderboard:
+        if metric == 'streak':
+            value = f"{entry['value']} day{'s' if entry['value'] != 1 else ''}"
+        else:
+            value = TimeTracker.format_duration(entry['value'])
+        print(f"{entry['rank']:>3}. {entry['username']}: {value}")
+
+
 def main():
     parser = argparse.ArgumentParser(description='Time tracking tool with multiple output options.')
-    parser.add_argument('--username', required=True, help='Username to include in messages')
+    parser.add_argument('--username', help='Username to include in messages')
+
+    # Leaderboard options.
+    parser.add_argument(
+        '--leaderboard',
+        nargs='?',
+        const='total',
+        choices=LEADERBOARD_METRICS,
+        help='Print a leaderboard of users and exit (default metric: total)'
+    )
+    parser.add_argument(
+        '--type',
+        choices=('online', 'offline'),
+        default='offline',
+        help='Session type to rank the leaderboard by (default: offline)'
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=10,
+        help='Number of users to show in the leaderboard (default: 10)'
+    )
+    parser.add_argument(
+        '--days',
+        type=int,
+        help='Only rank sessions from the last N days'
+    )
+
+    # Streak options.
+    parser.add_argument(
+        '--streak-goal',
+        type=float,
+        default=DEFAULT_STREAK_GOAL / 3600,
+        help='Offline hours needed in a day to extend a streak (default: 2)'
+    )
+    parser.add_argument(
+        '--rebuild-streaks',
+        action='store_true',
+        help='Recompute streaks for all users from the session history and exit'
+    )
 
     # Output handler options.
     parser.add_argument(
@@ -27,12 +94,48 @@ def main():
         help='Enable console output'
     )
 
+    # Database options.
+    parser.add_argument(
+        '--migrate',
+        action='store_true',
+        help='Upgrade the database and run all pending backfills to completion, then exit'
+    )
+
     args = parser.parse_args()
 
+    if args.streak_goal <= 0:
+        parser.error('--streak-goal must be greater than 0')
+    streak_goal = args.streak_goal * 3600
+
+    if args.migrate:
+        db = Db(streak_goal=streak_goal, backfill_budget=None)
+        pending = db.pending_backfills()
+        db.run_backfills()
+        print(f"Database is up to date. Completed backfills: {', '.join(pending) or 'none'}.")
+        return
+
+    if args.rebuild_streaks:
+        count = Db(streak_goal=streak_goal).rebuild_streaks()
+        print(f"Rebuilt streaks for {count} user{'s' if count != 1 else ''}.")
+        return
+
+    if args.leaderboard:
+        if args.top < 1:
+            parser.error('--top must be at least 1')
+        if args.days is not None and args.days < 1:
+            parser.error('--days must be at least 1')
+        if args.leaderboard == 'streak' and args.days:
+            parser.error('--days cannot be used with the streak leaderboard')
+        print_leaderboard(args.leaderboard, args.type, args.top, args.days, streak_goal)
+        return
+
+    if not args.username:
+        parser.error('--username is required unless --leaderboard, --rebuild-streaks or --migrate is given')
+
     if not any([args.discord, args.file, args.console]):
         parser.error('At least one output handler must be specified (--discord, --file, or --console)')
 
-    tracker = TimeTracker(args.username)
+    tracker = TimeTracker(args.username, streak_goal=streak_goal)
 
     if args.discord:
         discord_output = DiscordOutput(args.username)
@@ -1,35 +1,132 @@
 from __future__ import annotations
 
 import sqlite3
+from datetime import date, datetime, time, timedelta
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
 from go_touch_grass.config import DB_FILE, ensure_dirs_exist
+from go_touch_grass.migrations import migrate, run_backfills
+
+LEADERBOARD_METRICS: tuple[str, ...] = ('total', 'longest', 'streak')
+
+# Offline seconds needed in a day for it to count towards a streak.
+DEFAULT_STREAK_GOAL: float = 2 * 3600
+
+# Seconds of backfill work allowed while opening the database.
+DEFAULT_BACKFILL_BUDGET: float = 1.0
+
+
+def new_streak_state() -> dict[str, Any]:
+    """Return streak state for a user without any offline time."""
+    return {'current': 0, 'longest': 0, 'last_met_day': None, 'day': None, 'day_total': 0.0}
+
+
+def advance_streak(state: dict[str, Any], start_time: float, end_time: float, goal: float) -> bool:
+    """
+    Add an offline session to a user's streak state in place.
+
+    The session is split at local midnights so time is credited to the day it
+    happened on. Days are taken from the local timezone at the time of the
+    session. If a timezone change moves a session onto a day before the one
+    being tracked, its time is credited to the tracked day instead.
+
+    Args:
+        state: Streak state from new_streak_state() or the streaks table
+        start_time: Unix timestamp
+        end_time: Unix timestamp
+        goal: Offline seconds needed in a day
+
+    Returns:
+        bool: True if the longest streak grew
+    """
+    old_longest = state['longest']
+    tracked_day = date.fromisoformat(state['day']) if state['day'] else None
+
+    while start_time < end_time:
+        day = datetime.fromtimestamp(start_time).date()
+        day_end = min(end_time, datetime.combine(day + timedelta(days=1), time()).timestamp())
+        seconds = day_end - start_time
+        start_time = day_end
+
+        if tracked_day is not None and day < tracked_day:
+            day = tracked_day
+        if day != tracked_day:
+            tracked_day = day
+            state['day'] = day.isoformat()
+            state['day_total'] = 0.0
+
+        goal_met_before = state['day_total'] >= goal
+        state['day_total'] += seconds
+        if goal_met_before or state['day_total'] < goal:
+            continue
+
+        last_met_day = date.fromisoformat(state['last_met_day']) if state['last_met_day'] else None
+        if last_met_day == day - timedelta(days=1):
+            state['current'] += 1
+        else:
+            state['current'] = 1
+        state['last_met_day'] = day.isoformat()
+        state['longest'] = max(state['longest'], state['current'])
+
+    return state['longest'] > old_longest
 
 
 class Db:
-    def __init__(self, db_path: Path | str | None = None) -> None:
+    def __init__(
+        self,
+        db_path: Path | str | None = None,
+        streak_goal: float = DEFAULT_STREAK_GOAL,
+        backfill_budget: float | None = DEFAULT_BACKFILL_BUDGET
+    ) -> None:
+        """
+        Open the database, migrating it to the latest schema.
+
+        Args:
+            db_path: Database file, defaults to DB_FILE
+            streak_goal: Offline seconds needed in a day to extend a streak
+            backfill_budget: Seconds of pending backfill work to do while opening.
+                At least one chunk runs for any number, including 0. None skips
+                backfills, leaving them to run_backfills().
+        """
         ensure_dirs_exist()
         self.db_path: Path | str = db_path if db_path else DB_FILE
-        self._init_db()
+        self.streak_goal: float = streak_goal
+        self._init_db(backfill_budget)
 
-    def _init_db(self) -> None:
-        """Initialize the database with required tables."""
+    def _init_db(self, backfill_budget: float | None = DEFAULT_BACKFILL_BUDGET) -> None:
+        """Migrate the database to the latest schema and make progress on pending backfills."""
+        with sqlite3.connect(self.db_path) as conn:
+            migrate(conn)
+
+        if backfill_budget is not None and self.pending_backfills():
+            self.run_backfills(time_budget=backfill_budget)
+
+    def pending_backfills(self) -> list[str]:
+        """Return the names of backfills that have not finished yet."""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL,
-                    start_time REAL NOT NULL,
-                    end_time REAL NOT NULL,
-                    duration REAL NOT NULL,
-                    type TEXT NOT NULL CHECK (type IN ('online', 'offline')),
-                    is_record INTEGER DEFAULT 0,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            conn.commit()
+            cursor.execute('SELECT name FROM backfills WHERE done = 0 ORDER BY rowid')
+            return [row[0] for row in cursor.fetchall()]
+
+    def run_backfills(
+        self,
+        time_budget: float | None = None,
+        chunk_size: int | None = None,
+        should_stop: Callable[[], bool] | None = None
+    ) -> bool:
+        """
+        Continue pending backfills from their last checkpoint.
+
+        Args:
+            time_budget: Seconds after which to stop, None to run to completion
+            chunk_size: Override the default chunk size of every backfill
+            should_stop: Checked after every committed chunk, stops early when it returns True
+
+        Returns:
+            bool: True if no backfills are left pending
+        """
+        return run_backfills(self, time_budget=time_budget, chunk_size=chunk_size, should_stop=should_stop)
 
     def save_session(self, username: str, session_type: str, start_time: float, end_time: float, duration: float) -> bool:
         """
@@ -45,17 +142,52 @@ class Db:
         Returns:
             bool: True if this is a new record, False otherwise
         """
+        return self.record_session(username, session_type, start_time, end_time, duration)['is_record']
+
+    def record_session(
+        self,
+        username: str,
+        session_type: str,
+        start_time: float,
+        end_time: float,
+        duration: float
+    ) -> dict[str, Any]:
+        """
+        Save a session to the database and update the user's streak.
+
+        Args:
+            username: User identifier
+            session_type: 'online' or 'offline'
+            start_time: Unix timestamp
+            end_time: Unix timestamp
+            duration: Duration in seconds
+
+        Returns:
+            dict: is_record for a new longest session, is_streak_record for a
+                new longest streak, and streak in days: the new longest streak
+                if is_streak_record, otherwise the current streak as of this
+                session. streak is None for online sessions, and for users the
+                streaks backfill has not finished yet.
+        """
         with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
-            # Check if this is a record duration
-            cursor.execute('''
-                SELECT MAX(duration) FROM sessions
-                WHERE username = ? AND type = ?
-            ''', (username, session_type))
-            max_duration = cursor.fetchone()[0]
+            # Check if this is a record duration, from the sessions themselves
+            # while user_totals is still being backfilled.
+            if self._backfill_done(cursor, 'user_totals'):
+                cursor.execute('''
+                    SELECT longest FROM user_totals
+                    WHERE username = ? AND type = ?
+                ''', (username, session_type))
+            else:
+                cursor.execute('''
+                    SELECT MAX(duration) FROM sessions
+                    WHERE username = ? AND type = ?
+                ''', (username, session_type))
+            row = cursor.fetchone()
 
-            is_record = max_duration is None or duration > max_duration
+            is_record = row is None or row[0] is None or duration > row[0]
 
             # Insert the new session
             cursor.execute('''
@@ -63,10 +195,166 @@ class Db:
                 (username, start_time, end_time, duration, type, is_record)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (username, start_time, end_time, duration, session_type, int(is_record)))
+            session_id = cursor.lastrowid
+
+            # Update the user's aggregates.
+            cursor.execute('''
+                INSERT INTO user_totals (username, type, total, longest, session_count)
+                VALUES (?, ?, ?, ?, 1)
+                ON CONFLICT (username, type) DO UPDATE SET
+                    total = total + excluded.total,
+                    longest = MAX(longest, excluded.longest),
+                    session_count = session_count + 1
+            ''', (username, session_type, duration, duration))
+
+            # Only offline time counts towards streaks.
+            streak = None
+            is_streak_record = False
+            if session_type == 'offline':
+                cursor.execute('''
+                    SELECT goal, current, longest, last_met_day, day, day_total
+                    FROM streaks
+                    WHERE username = ?
+                ''', (username,))
+                row = cursor.fetchone()
+                # Users the streaks backfill has not finished are left to it, it
+                # replays the new session along with the rest of their history.
+                if not self._streak_backfill_pending(cursor, username):
+                    if row is not None and row['goal'] != self.streak_goal:
+                        # The goal changed, rebuild from earlier sessions under the new one.
+                        state = self._replay_streak(cursor, username, before_id=session_id)
+                    else:
+                        state = dict(row) if row else new_streak_state()
+                    is_streak_record = advance_streak(state, start_time, end_time, self.streak_goal)
+                    self._save_streak(cursor, username, state)
+                    if is_streak_record:
+                        streak = state['longest']
+                    else:
+                        streak = self._current_streak(state, datetime.fromtimestamp(end_time).date())
 
             conn.commit()
 
-            return is_record
+        return {'is_record': is_record, 'streak': streak, 'is_streak_record': is_streak_record}
+
+    @staticmethod
+    def _backfill_done(cursor: sqlite3.Cursor, name: str) -> bool:
+        """Whether a backfill has finished, or was never needed."""
+        cursor.execute('SELECT done FROM backfills WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        return row is None or bool(row[0])
+
+    @staticmethod
+    def _streak_backfill_pending(cursor: sqlite3.Cursor, username: str) -> bool:
+        """Whether the streaks backfill still has to replay some of a user's sessions."""
+        cursor.execute("SELECT done, last_id, last_key FROM backfills WHERE name = 'streaks'")
+        row = cursor.fetchone()
+        if row is None or row[0]:
+            return False
+        # Users before last_key are finished, last_key itself only once last_id is reset.
+        return username > row[2] or (username == row[2] and row[1] != 0)
+
+    @staticmethod
+    def _current_streak(state: dict[str, Any], today: date) -> int:
+        """Current streak on a day, 0 if a full day has passed without meeting the goal."""
+        if state['last_met_day'] and date.fromisoformat(state['last_met_day']) >= today - timedelta(days=1):
+            return state['current']
+        return 0
+
+    def _replay_streak(
+        self,
+        cursor: sqlite3.Cursor,
+        username: str,
+        before_id: int | None = None
+    ) -> dict[str, Any]:
+        """Compute a user's streak state from their offline history, or only sessions before before_id."""
+        state = new_streak_state()
+        cursor.execute('''
+            SELECT start_time, end_time
+            FROM sessions
+            WHERE username = ? AND type = 'offline' AND (? IS NULL OR id < ?)
+            ORDER BY start_time
+        ''', (username, before_id, before_id))
+        for start_time, end_time in cursor.fetchall():
+            advance_streak(state, start_time, end_time, self.streak_goal)
+        return state
+
+    def _save_streak(self, cursor: sqlite3.Cursor, username: str, state: dict[str, Any]) -> None:
+        """Write a user's streak state."""
+        cursor.execute('''
+            INSERT OR REPLACE INTO streaks
+            (username, goal, current, longest, last_met_day, day, day_total)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            username, self.streak_goal, state['current'], state['longest'],
+            state['last_met_day'], state['day'], state['day_total']
+        ))
+
+    def rebuild_streaks(self, username: str | None = None) -> int:
+        """
+        Recompute streaks from the session history.
+
+        Args:
+            username: Only rebuild this user, all users if None
+
+        Returns:
+            int: Number of users rebuilt
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            if username is None:
+                cursor.execute("SELECT DISTINCT username FROM sessions WHERE type = 'offline'")
+                usernames = [row[0] for row in cursor.fetchall()]
+                cursor.execute('DELETE FROM streaks')
+                cursor.execute("UPDATE backfills SET done = 1 WHERE name = 'streaks'")
+            else:
+                usernames = [username]
+                cursor.execute('DELETE FROM streaks WHERE username = ?', (username,))
+                # Don't let a backfill part way through this user resume on top of the rebuilt state.
+                cursor.execute('''
+                    UPDATE backfills SET last_id = 0
+                    WHERE name = 'streaks' AND done = 0 AND last_key = ?
+                ''', (username,))
+
+            for name in usernames:
+                self._save_streak(cursor, name, self._replay_streak(cursor, name))
+            conn.commit()
+
+        return len(usernames)
+
+    def get_streak(self, username: str, today: date | None = None) -> dict[str, Any]:
+        """
+        Get streak information for a user.
+
+        A streak stays current while today's goal has not been met yet, and is
+        reported as 0 once a full day passes without meeting the goal.
+
+        Args:
+            username: User identifier
+            today: Local date to evaluate the streak on, defaults to today
+
+        Returns:
+            dict: current and longest streak in days, goal in seconds
+                and today's offline seconds
+        """
+        today = today if today else date.today()
+        streak = {'current': 0, 'longest': 0, 'goal': self.streak_goal, 'today': 0.0}
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT current, longest, last_met_day, day, day_total
+                FROM streaks
+                WHERE username = ?
+            ''', (username,))
+            row = cursor.fetchone()
+
+        if row:
+            streak['longest'] = row['longest']
+            streak['current'] = self._current_streak(dict(row), today)
+            if row['day'] == today.isoformat():
+                streak['today'] = row['day_total']
+        return streak
 
     def get_stats(self, username: str) -> dict[str, dict[str, Any]]:
         """
@@ -130,3 +418,81 @@ class Db:
             stats['offline']['total'] = row['total'] if row['total'] else 0
 
         return stats
+
+    def get_leaderboard(
+        self,
+        metric: str = 'total',
+        session_type: str = 'offline',
+        limit: int = 10,
+        since: float | None = None,
+        until: float | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        Rank users by a session metric.
+
+        All-time rankings are read from the indexed user_totals and streaks
+        tables. When a time window is given, or while user_totals is still
+        being backfilled, sessions are aggregated directly instead.
+
+        Args:
+            metric: 'total' for summed duration, 'longest' for longest session,
+                'streak' for longest streak in days, counting only users whose
+                streak was last computed with this Db's streak goal
+            session_type: 'online' or 'offline', ignored for 'streak'
+            limit: Maximum number of users to return
+            since: Optional Unix timestamp, inclusive lower bound on start_time
+            until: Optional Unix timestamp, exclusive upper bound on start_time
+
+        Returns:
+            list: Dictionaries with rank, username and value, best first
+
+        Raises:
+            RuntimeError: For the streak metric while streaks are still being backfilled
+        """
+        if metric not in LEADERBOARD_METRICS:
+            raise ValueError(f"Unknown leaderboard metric: {metric}")
+        if metric == 'streak' and (since is not None or until is not None):
+            raise ValueError("Streak leaderboard does not support a time window")
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+
+            if metric == 'streak':
+                if not self._backfill_done(cursor, 'streaks'):
+                    raise RuntimeError("Streaks are still being backfilled, finish them with run_backfills()")
+                cursor.execute('''
+                    SELECT username, longest AS value
+                    FROM streaks
+                    WHERE longest > 0 AND goal = ?
+                    ORDER BY longest DESC, username
+                    LIMIT ?
+                ''', (self.streak_goal, limit))
+            elif since is None and until is None and self._backfill_done(cursor, 'user_totals'):
+                cursor.execute(f'''
+                    SELECT username, {metric} AS value
+                    FROM user_totals
+                    WHERE type = ?
+                    ORDER BY {metric} DESC, username
+                    LIMIT ?
+                ''', (session_type, limit))
+            else:
+                aggregate = 'SUM' if metric == 'total' else 'MAX'
+                cursor.execute(f'''
+                    SELECT username, {aggregate}(duration) AS value
+                    FROM sessions
+                    WHERE type = ? AND start_time >= ? AND start_time < ?
+                    GROUP BY username
+                    ORDER BY value DESC, username
+                    LIMIT ?
+                ''', (
+                    session_type,
+                    since if since is not None else float('-inf'),
+                    until if until is not None else float('inf'),
+                    limit
+                ))
+
+            return [
+                {'rank': rank, 'username': row['username'], 'value': row['value']}
+                for rank, row in enumerate(cursor.fetchall(), start=1)
+            ]
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+import time
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from go_touch_grass.database import Db
+
+logger = logging.getLogger(__name__)
+
+# Schema migrations as (version, description, statements, backfills to start).
+# Statements must be quick: anything that has to touch every session belongs
+# in a backfill, which runs in resumable chunks after the schema is upgraded.
+MIGRATIONS: list[tuple[int, str, tuple[str, ...], tuple[str, ...]]] = [
+    (1, 'Create sessions table', (
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            start_time REAL NOT NULL,
+            end_time REAL NOT NULL,
+            duration REAL NOT NULL,
+            type TEXT NOT NULL CHECK (type IN ('online', 'offline')),
+            is_record INTEGER DEFAULT 0,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ), ()),
+    (2, 'Add per-user totals', (
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_type_start
+        ON sessions (type, start_time)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_totals (
+            username TEXT NOT NULL,
+            type TEXT NOT NULL CHECK (type IN ('online', 'offline')),
+            total REAL NOT NULL DEFAULT 0,
+            longest REAL NOT NULL DEFAULT 0,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, type)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_user_totals_total
+        ON user_totals (type, total DESC)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_user_totals_longest
+        ON user_totals (type, longest DESC)
+        ''',
+        # Start from scratch, the backfill recomputes every existing row.
+        'DELETE FROM user_totals',
+    ), ('user_totals',)),
+    (3, 'Add streaks', (
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_type_start
+        ON sessions (username, type, start_time)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS streaks (
+            username TEXT PRIMARY KEY,
+            goal REAL NOT NULL,
+            current INTEGER NOT NULL DEFAULT 0,
+            longest INTEGER NOT NULL DEFAULT 0,
+            last_met_day TEXT,
+            day TEXT,
+            day_total REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_streaks_longest
+        ON streaks (longest DESC)
+        ''',
+        'DELETE FROM streaks',
+    ), ('streaks',)),
+]
+
+SCHEMA_VERSION: int = MIGRATIONS[-1][0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Apply pending schema migrations, tracking the version in PRAGMA user_version.
+
+    Each migration runs in its own transaction together with the version bump,
+    and registers its backfills so they can be run later with run_backfills().
+
+    Args:
+        conn: Open database connection
+
+    Returns:
+        int: Number of migrations applied
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backfills (
+            name TEXT PRIMARY KEY,
+            target_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            last_key TEXT NOT NULL DEFAULT '',
+            done INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.commit()
+
+    cursor.execute('PRAGMA user_version')
+    version = cursor.fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than supported version {SCHEMA_VERSION}")
+
+    applied = 0
+    for target_version, description, statements, backfills in MIGRATIONS:
+        if target_version <= version:
+            continue
+
+        logger.info(f"Migrating database to version {target_version}: {description}")
+        cursor.execute('BEGIN')
+        for statement in statements:
+            cursor.execute(statement)
+        for name in backfills:
+            # Rows above target_id are kept up to date by the write path.
+            cursor.execute('''
+                INSERT OR REPLACE INTO backfills (name, target_id)
+                VALUES (?, (SELECT COALESCE(MAX(id), 0) FROM sessions))
+            ''', (name,))
+        cursor.execute(f'PRAGMA user_version = {target_version}')
+        conn.commit()
+        applied += 1
+
+    return applied
+
+
+def _backfill_user_totals(
+    db: Db,
+    cursor: sqlite3.Cursor,
+    last_id: int,
+    last_key: str,
+    target_id: int,
+    chunk_size: int
+) -> tuple[int, str, bool]:
+    """Add the sessions in the next id range to user_totals."""
+    end_id = min(last_id + chunk_size, target_id)
+    cursor.execute('''
+        INSERT INTO user_totals (username, type, total, longest, session_count)
+        SELECT username, type, SUM(duration), MAX(duration), COUNT(*)
+        FROM sessions
+        WHERE id > ? AND id <= ?
+        GROUP BY username, type
+        ON CONFLICT (username, type) DO UPDATE SET
+            total = total + excluded.total,
+            longest = MAX(longest, excluded.longest),
+            session_count = session_count + excluded.session_count
+    ''', (last_id, end_id))
+    return end_id, last_key, end_id >= target_id
+
+
+def _backfill_streaks(
+    db: Db,
+    cursor: sqlite3.Cursor,
+    last_id: int,
+    last_key: str,
+    target_id: int,
+    chunk_size: int
+) -> tuple[int, str, bool]:
+    """
+    Replay the next offline sessions in (username, start_time, id) order.
+
+    The checkpoint is the user being replayed and the id of their last replayed
+    session, 0 once the user is finished. Partial state is kept in the user's
+    streaks row, so one user's history can span many chunks.
+    """
+    from go_touch_grass.database import advance_streak, new_streak_state
+
+    username = last_key
+    processed = 0
+    while processed < chunk_size:
+        if last_id:
+            cursor.execute('SELECT start_time FROM sessions WHERE id = ?', (last_id,))
+            row = cursor.fetchone()
+            cursor.execute('''
+                SELECT current, longest, last_met_day, day, day_total
+                FROM streaks
+                WHERE username = ?
+            ''', (username,))
+            state_row = cursor.fetchone()
+            if row is None or state_row is None:
+                # The checkpoint is gone, replay this user from the start.
+                last_id, last_start, state = 0, float('-inf'), new_streak_state()
+            else:
+                last_start = row[0]
+                state = dict(zip(('current', 'longest', 'last_met_day', 'day', 'day_total'), state_row))
+        else:
+            # Move on to the next user with offline sessions. Without the hint
+            # SQLite picks the type index and sorts every offline session.
+            cursor.execute('''
+                SELECT username FROM sessions INDEXED BY idx_sessions_user_type_start
+                WHERE username > ? AND type = 'offline'
+                ORDER BY username
+                LIMIT 1
+            ''', (username,))
+            row = cursor.fetchone()
+            if row is None:
+                return 0, username, True
+            username, last_start, state = row[0], float('-inf'), new_streak_state()
+
+        limit = chunk_size - processed
+        cursor.execute('''
+            SELECT id, start_time, end_time
+            FROM sessions
+            WHERE username = ? AND type = 'offline' AND (start_time, id) > (?, ?)
+            ORDER BY start_time, id
+            LIMIT ?
+        ''', (username, last_start, last_id, limit))
+        rows = cursor.fetchall()
+        for _, start_time, end_time in rows:
+            advance_streak(state, start_time, end_time, db.streak_goal)
+        db._save_streak(cursor, username, state)
+
+        processed += len(rows)
+        last_id = rows[-1][0] if len(rows) == limit else 0
+
+    return last_id, username, False
+
+
+# Backfill name -> (chunk function, sessions per chunk).
+BACKFILLS: dict[str, tuple[Callable[..., tuple[int, str, bool]], int]] = {
+    'user_totals': (_backfill_user_totals, 100_000),
+    'streaks': (_backfill_streaks, 20_000),
+}
+
+
+def run_backfills(
+    db: Db,
+    time_budget: float | None = None,
+    chunk_size: int | None = None,
+    should_stop: Callable[[], bool] | None = None
+) -> bool:
+    """
+    Run pending backfills chunk by chunk, checkpointing after every chunk.
+
+    At least one chunk runs per call, so repeated calls always make progress.
+    An interrupted run resumes from the last checkpoint.
+
+    Args:
+        db: Database to backfill
+        time_budget: Seconds after which to stop, None to run to completion
+        chunk_size: Override the default chunk size of every backfill
+        should_stop: Checked after every committed chunk, stops early when it returns True
+
+    Returns:
+        bool: True if no backfills are left pending
+    """
+    started = time.monotonic()
+    with sqlite3.connect(db.db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT name, target_id, last_id, last_key
+            FROM backfills
+            WHERE done = 0
+            ORDER BY rowid
+        ''')
+        pending = cursor.fetchall()
+
+        for name, target_id, last_id, last_key in pending:
+            backfill, default_chunk_size = BACKFILLS[name]
+            done = False
+            while not done:
+                last_id, last_key, done = backfill(
+                    db, cursor, last_id, last_key, target_id, chunk_size or default_chunk_size
+                )
+                cursor.execute('''
+                    UPDATE backfills
+                    SET last_id = ?, last_key = ?, done = ?
+                    WHERE name = ?
+                ''', (last_id, last_key, int(done), name))
+                conn.commit()
+
+                if done:
+                    logger.info(f"Backfill {name} complete")
+                out_of_time = time_budget is not None and time.monotonic() - started >= time_budget
+                if out_of_time or (should_stop is not None and should_stop()):
+                    if not done:
+                        logger.info(f"Backfill {name} paused at checkpoint, will resume later")
+                    return done and name == pending[-1][0]
+
+    return True
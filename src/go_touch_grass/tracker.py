@@ -13,7 +13,7 @@ from types import FrameType
 from typing import Any
 
 from go_touch_grass.config import STATE_FILE, LOG_FILE, ensure_dirs_exist
-from go_touch_grass.database import Db
+from go_touch_grass.database import Db, DEFAULT_STREAK_GOAL
 
 ensure_dirs_exist()
 
@@ -28,14 +28,19 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Seconds of backfill work done per minute while the tracker runs.
+BACKFILL_BUDGET: float = 5.0
+
 
 class TimeTracker:
-    def __init__(self, username: str) -> None:
+    def __init__(self, username: str, streak_goal: float = DEFAULT_STREAK_GOAL) -> None:
         self.username: str = username
         self.data_file: Path = Path(STATE_FILE)
         self.state: dict[str, Any] = self.load_state() or {'running': False}
         self.output_handlers: list[Any] = []
-        self.db: Db = Db()
+        self.db: Db = Db(streak_goal=streak_goal)
+        self.backfilling: bool = False
+        self.deferred_signal: int | None = None
 
         # Check for existing running session.
         if self.state.get('running', False):
@@ -97,6 +102,12 @@ class TimeTracker:
 
     def handle_shutdown(self, signum: int | None = None, frame: FrameType | None = None) -> None:
         """Handle termination signals."""
+        if self.backfilling:
+            # Saving the session now would wait on the backfill's own write lock.
+            logger.info(f"Received shutdown signal: {signum} - shutting down after the current backfill chunk")
+            self.deferred_signal = signum
+            return
+
         logger.info(f"Received shutdown signal: {signum}")
         self.on_shutdown()
         sys.exit(0)
@@ -148,8 +159,8 @@ class TimeTracker:
         end_time = time.time()
         offline_duration = end_time - start_time
 
-        # Save to database and check if it's a new record.
-        is_new_record = self.db.save_session(
+        # Save to database and check for new records.
+        result = self.db.record_session(
             username=self.username,
             session_type='offline',
             start_time=start_time,
@@ -159,12 +170,19 @@ class TimeTracker:
 
         duration_str = self.format_duration(offline_duration)
         message = f"{self.username} touched grass for: {duration_str}."
-        if is_new_record:
+        if result['is_record']:
             message += " New record!"
         self.send_to_outputs(message)
         logger.info(message)
 
-    def format_duration(self, seconds: float) -> str:
+        if result['is_streak_record']:
+            days = result['streak']
+            message = f"{self.username} reached a new longest streak: {days} day{'s' if days != 1 else ''}!"
+            self.send_to_outputs(message)
+            logger.info(message)
+
+    @staticmethod
+    def format_duration(seconds: float) -> str:
         """Format seconds into human-readable time."""
         duration = timedelta(seconds=seconds)
         parts = []
@@ -236,6 +254,18 @@ class TimeTracker:
         # Keep running until shutdown.
         try:
             while True:
+                # Finish schema upgrades a little at a time.
+                if self.db.pending_backfills():
+                    self.backfilling = True
+                    try:
+                        self.db.run_backfills(
+                            time_budget=BACKFILL_BUDGET,
+                            should_stop=lambda: self.deferred_signal is not None
+                        )
+                    finally:
+                        self.backfilling = False
+                    if self.deferred_signal is not None:
+                        self.handle_shutdown(self.deferred_signal)
                 time.sleep(60)  # Check every minute.
         except Exception as e:
             logger.error(f"Main loop error: {e}")
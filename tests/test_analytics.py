@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Generator
+from datetime import datetime, timezone
+from pathlib import Path
+import pytest
+from go_touch_grass.database import Db
+
+np = pytest.importorskip('numpy')
+
+from go_touch_grass.analytics import SessionCache  # noqa: E402
+
+HOUR = 3600
+DAY = 86400
+# 2024-01-01 00:00 UTC, a Monday.
+MONDAY = 1704067200
+
+
+@pytest.fixture
+def db(tmp_path: Path) -> Db:
+    return Db(tmp_path / "test.db")
+
+
+@pytest.fixture
+def cache(db: Db, tmp_path: Path) -> SessionCache:
+    return SessionCache(db, tmp_path / "cache", chunk_size=2)
+
+
+def test_refresh_is_incremental(db: Db, cache: SessionCache, tmp_path: Path) -> None:
+    db.save_session("alice", "offline", MONDAY, MONDAY + HOUR, HOUR)
+    db.save_session("bob", "online", MONDAY, MONDAY + 2 * HOUR, 2 * HOUR)
+    db.save_session("alice", "offline", MONDAY + DAY, MONDAY + DAY + HOUR, HOUR)
+    assert cache.refresh() == 3
+    assert cache.refresh() == 0
+
+    db.save_session("bob", "offline", MONDAY, MONDAY + HOUR, HOUR)
+    reopened = SessionCache(db, tmp_path / "cache")
+    assert reopened.refresh() == 1
+    assert list(reopened.column('id')) == [1, 2, 3, 4]
+    assert reopened.meta['users'] == ["alice", "bob"]
+
+
+def test_cache_rebuilds_for_other_database(db: Db, tmp_path: Path) -> None:
+    db.save_session("alice", "offline", MONDAY, MONDAY + HOUR, HOUR)
+    SessionCache(db, tmp_path / "cache").refresh()
+
+    other = Db(tmp_path / "other.db")
+    other.save_session("bob", "offline", MONDAY, MONDAY + 2 * HOUR, 2 * HOUR)
+    other.save_session("bob", "offline", MONDAY + DAY, MONDAY + DAY + HOUR, HOUR)
+    cache = SessionCache(other, tmp_path / "cache")
+    assert cache.refresh() == 2
+    assert cache.meta['users'] == ["bob"]
+
+
+def test_cache_rebuilds_for_recreated_database(db: Db, tmp_path: Path) -> None:
+    db.save_session("alice", "offline", MONDAY, MONDAY + HOUR, HOUR)
+    db.save_session("alice", "offline", MONDAY + DAY, MONDAY + DAY + HOUR, HOUR)
+    SessionCache(db, tmp_path / "cache").refresh()
+
+    Path(db.db_path).unlink()
+    db = Db(db.db_path)
+    db.save_session("bob", "offline", MONDAY + 2 * DAY, MONDAY + 2 * DAY + HOUR, HOUR)
+    db.save_session("bob", "offline", MONDAY + 3 * DAY, MONDAY + 3 * DAY + HOUR, HOUR)
+    cache = SessionCache(db, tmp_path / "cache")
+    assert cache.refresh() == 2
+    assert list(cache.column('start')) == [MONDAY + 2 * DAY, MONDAY + 3 * DAY]
+
+
+def test_default_cache_dir_depends_on_database(db: Db, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr('go_touch_grass.analytics.SESSION_CACHE_DIR', tmp_path / "sessions")
+    assert SessionCache(db).cache_dir != SessionCache(Db(tmp_path / "other.db")).cache_dir
+
+
+def test_refresh_drops_partial_append(db: Db, cache: SessionCache) -> None:
+    db.save_session("alice", "offline", MONDAY, MONDAY + HOUR, HOUR)
+    cache.refresh()
+    with open(cache._column_file('start'), 'ab') as f:
+        f.write(b'\0' * 8)
+
+    db.save_session("alice", "offline", MONDAY + DAY, MONDAY + DAY + HOUR, HOUR)
+    assert cache.refresh() == 1
+    assert list(cache.column('start')) == [MONDAY, MONDAY + DAY]
+
+
+def test_binned_totals_split_sessions(db: Db, cache: SessionCache) -> None:
+    db.save_session("alice", "offline", MONDAY + 30 * 60, MONDAY + 90 * 60, HOUR)
+    cache.refresh()
+
+    edges = [MONDAY, MONDAY + HOUR, MONDAY + 2 * HOUR]
+    assert list(cache.binned_totals(edges)) == [30 * 60, 30 * 60]
+
+
+def test_daily_totals_and_heatmap(db: Db, cache: SessionCache) -> None:
+    # Crosses midnight from Monday into Tuesday.
+    db.save_session("alice", "offline", MONDAY + 23 * HOUR, MONDAY + 25 * HOUR, 2 * HOUR)
+    db.save_session("alice", "online", MONDAY, MONDAY + HOUR, HOUR)
+    cache.refresh()
+
+    days, totals = cache.daily_totals(tz=timezone.utc)
+    assert [str(d) for d in days] == ["2024-01-01", "2024-01-02"]
+    assert list(totals) == [HOUR, HOUR]
+
+    heatmap = cache.time_of_day_heatmap(tz=timezone.utc)
+    assert heatmap[0, 23] == HOUR
+    assert heatmap[1, 0] == HOUR
+    assert heatmap.sum() == 2 * HOUR
+    assert cache.hour_of_day_histogram(session_type='online', tz=timezone.utc)[0] == HOUR
+
+
+def test_gap_analysis(db: Db, cache: SessionCache) -> None:
+    db.save_session("alice", "online", MONDAY, MONDAY + HOUR, HOUR)
+    db.save_session("bob", "online", MONDAY, MONDAY + HOUR, HOUR)
+    db.save_session("alice", "online", MONDAY + 3 * HOUR, MONDAY + 4 * HOUR, HOUR)
+    db.save_session("bob", "online", MONDAY + 2 * HOUR, MONDAY + 3 * HOUR, HOUR)
+    cache.refresh()
+
+    assert cache.gap_analysis("alice")['gaps'].tolist() == [2 * HOUR]
+    fleet = cache.gap_analysis()
+    assert fleet['count'] == 2
+    assert fleet['max'] == 2 * HOUR
+    assert cache.gap_analysis("nobody")['count'] == 0
+
+
+@pytest.fixture
+def helsinki() -> Generator[None, None, None]:
+    old_tz = os.environ.get('TZ')
+    os.environ['TZ'] = 'Europe/Helsinki'
+    time.tzset()
+    yield
+    if old_tz is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = old_tz
+    time.tzset()
+
+
+def test_buckets_follow_dst(helsinki: None, db: Db, cache: SessionCache) -> None:
+    # 00:30-01:30 local on a winter (UTC+2) and a summer (UTC+3) Monday.
+    for day in (datetime(2024, 1, 15, 0, 30), datetime(2024, 7, 15, 0, 30)):
+        start = day.timestamp()
+        db.save_session("alice", "offline", start, start + HOUR, HOUR)
+    # Across the spring-forward night, 03:00 local does not exist.
+    start = datetime(2024, 3, 31, 2, 0).timestamp()
+    db.save_session("alice", "online", start, start + 2 * HOUR, 2 * HOUR)
+    cache.refresh()
+
+    heatmap = cache.time_of_day_heatmap()
+    assert heatmap[0, 0] == 2 * 1800
+    assert heatmap[0, 1] == 2 * 1800
+    assert heatmap.sum() == 2 * HOUR
+
+    days, totals = cache.daily_totals()
+    assert str(days[0]) == "2024-01-15"
+    assert str(days[-1]) == "2024-07-15"
+    assert totals[0] == HOUR and totals[-1] == HOUR and totals.sum() == 2 * HOUR
+
+    histogram = cache.hour_of_day_histogram(session_type='online')
+    assert histogram[2] == HOUR
+    assert histogram[3] == 0
+    assert histogram[4] == HOUR
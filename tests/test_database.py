@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+import pytest
+from go_touch_grass.database import Db, DEFAULT_STREAK_GOAL, advance_streak, new_streak_state
+
+
+@pytest.fixture
+def db(tmp_path: Path) -> Db:
+    return Db(tmp_path / "test.db")
+
+
+def test_save_session_record(db: Db) -> None:
+    assert db.save_session("alice", "offline", 0, 100, 100) is True
+    assert db.save_session("alice", "offline", 200, 250, 50) is False
+    assert db.save_session("alice", "offline", 300, 500, 200) is True
+    assert db.save_session("alice", "online", 500, 510, 10) is True
+
+
+def test_leaderboard_all_time(db: Db) -> None:
+    db.save_session("alice", "offline", 0, 100, 100)
+    db.save_session("alice", "offline", 200, 250, 50)
+    db.save_session("bob", "offline", 0, 120, 120)
+    db.save_session("carol", "online", 0, 1000, 1000)
+
+    total = db.get_leaderboard(metric='total')
+    assert [(e['rank'], e['username'], e['value']) for e in total] == [(1, "alice", 150), (2, "bob", 120)]
+
+    longest = db.get_leaderboard(metric='longest', limit=1)
+    assert [(e['username'], e['value']) for e in longest] == [("bob", 120)]
+
+
+def test_leaderboard_window(db: Db) -> None:
+    db.save_session("alice", "offline", 0, 100, 100)
+    db.save_session("alice", "offline", 1000, 1050, 50)
+    db.save_session("bob", "offline", 1000, 1080, 80)
+
+    leaderboard = db.get_leaderboard(metric='total', since=500)
+    assert [(e['username'], e['value']) for e in leaderboard] == [("bob", 80), ("alice", 50)]
+
+
+def test_leaderboard_unknown_metric(db: Db) -> None:
+    with pytest.raises(ValueError):
+        db.get_leaderboard(metric='bogus')
+
+
+def test_user_totals_backfilled_for_existing_database(tmp_path: Path) -> None:
+    db_path = tmp_path / "old.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('''
+            CREATE TABLE sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                start_time REAL NOT NULL,
+                end_time REAL NOT NULL,
+                duration REAL NOT NULL,
+                type TEXT NOT NULL CHECK (type IN ('online', 'offline')),
+                is_record INTEGER DEFAULT 0,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO sessions (username, start_time, end_time, duration, type)
+            VALUES ('alice', 0, 300, 300, 'offline')
+        ''')
+
+    db = Db(db_path)
+    assert db.get_leaderboard()[0]['value'] == 300
+    assert db.save_session("alice", "offline", 400, 500, 100) is False
+
+
+def local(day: int, hour: float) -> float:
+    """Unix timestamp for a local time in January 2024."""
+    return datetime(2024, 1, day).timestamp() + hour * 3600
+
+
+def test_streak_consecutive_days(db: Db) -> None:
+    result = db.record_session("alice", "offline", local(1, 8), local(1, 11), 3 * 3600)
+    assert (result['is_streak_record'], result['streak']) == (True, 1)
+    result = db.record_session("alice", "offline", local(2, 8), local(2, 9), 3600)
+    assert (result['is_streak_record'], result['streak']) == (False, 1)
+    # Two sessions on the same day add up to the goal.
+    result = db.record_session("alice", "offline", local(2, 12), local(2, 13), 3600)
+    assert (result['is_streak_record'], result['streak']) == (True, 2)
+    assert db.record_session("alice", "online", local(2, 14), local(2, 15), 3600)['streak'] is None
+
+    streak = db.get_streak("alice", today=date(2024, 1, 3))
+    assert streak['current'] == 2
+    assert streak['longest'] == 2
+
+    # A missed day breaks the current streak but keeps the longest.
+    assert db.get_streak("alice", today=date(2024, 1, 4))['current'] == 0
+    db.record_session("alice", "offline", local(5, 8), local(5, 11), 3 * 3600)
+    assert db.get_streak("alice", today=date(2024, 1, 5)) == {
+        'current': 1, 'longest': 2, 'goal': DEFAULT_STREAK_GOAL, 'today': 3 * 3600
+    }
+
+
+def test_streak_session_across_midnight(db: Db) -> None:
+    # Three hours either side of midnight meets the goal on both days.
+    db.record_session("alice", "offline", local(1, 21), local(2, 3), 6 * 3600)
+    assert db.get_streak("alice", today=date(2024, 1, 2))['current'] == 2
+
+    # One hour either side of midnight meets it on neither.
+    db.record_session("bob", "offline", local(1, 23), local(2, 1), 2 * 3600)
+    assert db.get_streak("bob", today=date(2024, 1, 2))['longest'] == 0
+
+
+def test_streak_earlier_day_credits_tracked_day() -> None:
+    state = new_streak_state()
+    advance_streak(state, local(2, 8), local(2, 9), DEFAULT_STREAK_GOAL)
+    # Clock moved back across midnight, e.g. flying west.
+    advance_streak(state, local(1, 23), local(1, 23.5), DEFAULT_STREAK_GOAL)
+    advance_streak(state, local(2, 9), local(2, 9.5), DEFAULT_STREAK_GOAL)
+    assert state['day'] == "2024-01-02"
+    assert state['day_total'] == 2 * 3600
+    assert state['current'] == 1
+
+
+def test_rebuild_streaks(db: Db) -> None:
+    for day in (1, 2, 3):
+        db.record_session("alice", "offline", local(day, 8), local(day, 11), 3 * 3600)
+    db.record_session("bob", "offline", local(1, 8), local(1, 11), 3 * 3600)
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute('DELETE FROM streaks')
+
+    assert db.rebuild_streaks() == 2
+    assert db.get_streak("alice", today=date(2024, 1, 3))['current'] == 3
+    leaderboard = db.get_leaderboard(metric='streak')
+    assert [(e['username'], e['value']) for e in leaderboard] == [("alice", 3), ("bob", 1)]
+
+
+def test_streak_goal_change_replays_history(tmp_path: Path) -> None:
+    db = Db(tmp_path / "test.db")
+    db.record_session("alice", "offline", local(1, 8), local(1, 9), 3600)
+    assert db.get_streak("alice", today=date(2024, 1, 1))['longest'] == 0
+
+    db = Db(tmp_path / "test.db", streak_goal=1800)
+    result = db.record_session("alice", "offline", local(2, 8), local(2, 9), 3600)
+    assert (result['is_streak_record'], result['streak']) == (True, 2)
+    assert db.get_streak("alice", today=date(2024, 1, 2))['longest'] == 2
+
+
+def test_streak_goal_change_without_new_record(tmp_path: Path) -> None:
+    db = Db(tmp_path / "test.db")
+    for day in range(1, 6):
+        db.record_session("alice", "offline", local(day, 8), local(day, 9), 3600)
+
+    # The lower goal turns the old days into a 5 day streak, but this session
+    # neither meets the goal nor extends that streak.
+    db = Db(tmp_path / "test.db", streak_goal=1800)
+    result = db.record_session("alice", "offline", local(20, 8), local(20, 8.1), 360)
+    assert (result['is_streak_record'], result['streak']) == (False, 0)
+    assert db.get_streak("alice", today=date(2024, 1, 20))['longest'] == 5
+
+
+def test_streak_leaderboard_uses_current_goal(tmp_path: Path) -> None:
+    Db(tmp_path / "test.db").record_session("alice", "offline", local(1, 8), local(1, 11), 3 * 3600)
+    db = Db(tmp_path / "test.db", streak_goal=1800)
+    db.record_session("bob", "offline", local(1, 8), local(1, 9), 3600)
+
+    assert [e['username'] for e in db.get_leaderboard(metric='streak')] == ["bob"]
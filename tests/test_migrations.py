@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+import pytest
+from go_touch_grass import migrations
+from go_touch_grass.database import Db, DEFAULT_STREAK_GOAL
+from go_touch_grass.migrations import BACKFILLS, SCHEMA_VERSION
+
+
+@pytest.fixture
+def old_db(tmp_path: Path) -> Path:
+    """Database with the original, unversioned schema and some sessions."""
+    db_path = tmp_path / "old.db"
+    day = datetime(2024, 1, 1).timestamp()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(migrations.MIGRATIONS[0][2][0])
+        for i in range(3):
+            for username in ("alice", "bob", "carol"):
+                start = day + i * 86400
+                conn.execute('''
+                    INSERT INTO sessions (username, start_time, end_time, duration, type)
+                    VALUES (?, ?, ?, ?, 'offline')
+                ''', (username, start, start + 3 * 3600, 3 * 3600))
+    return db_path
+
+
+@pytest.fixture
+def small_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    for name, (backfill, _) in list(BACKFILLS.items()):
+        monkeypatch.setitem(BACKFILLS, name, (backfill, 2))
+
+
+def user_version(db: Db) -> int:
+    with sqlite3.connect(db.db_path) as conn:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def test_new_database_is_current(tmp_path: Path) -> None:
+    db = Db(tmp_path / "new.db")
+    assert user_version(db) == SCHEMA_VERSION
+    assert db.pending_backfills() == []
+
+
+def test_upgrade_runs_backfills_in_chunks(old_db: Path, small_chunks: None) -> None:
+    db = Db(old_db, backfill_budget=0)
+    assert user_version(db) == SCHEMA_VERSION
+    assert db.pending_backfills() == ["user_totals", "streaks"]
+
+    runs = 1
+    while not db.run_backfills(time_budget=0):
+        runs += 1
+    assert runs > 2
+    assert db.pending_backfills() == []
+
+    assert [e['value'] for e in db.get_leaderboard()] == [9 * 3600] * 3
+    assert db.get_streak("bob", today=date(2024, 1, 3))['current'] == 3
+
+
+def test_backfill_resumes_after_reopening(old_db: Path, small_chunks: None) -> None:
+    Db(old_db, backfill_budget=0)
+    db = Db(old_db, backfill_budget=0)
+    with sqlite3.connect(old_db) as conn:
+        last_id = conn.execute("SELECT last_id FROM backfills WHERE name = 'user_totals'").fetchone()[0]
+    assert last_id == 4
+
+    db.run_backfills()
+    assert db.get_stats("alice")['offline']['total'] == 9 * 3600
+
+
+def test_writes_during_backfill_are_counted_once(old_db: Path, small_chunks: None) -> None:
+    db = Db(old_db, backfill_budget=0)
+    assert "user_totals" in db.pending_backfills()
+
+    # Records are still judged against the full history.
+    assert db.save_session("alice", "offline", 0, 3600, 3600) is False
+    assert db.save_session("alice", "offline", 0, 4 * 3600, 4 * 3600) is True
+
+    db.run_backfills()
+    totals = {e['username']: e['value'] for e in db.get_leaderboard()}
+    assert totals == {"alice": 14 * 3600, "bob": 9 * 3600, "carol": 9 * 3600}
+
+
+def test_streak_during_backfill_is_left_to_backfill(old_db: Path, small_chunks: None) -> None:
+    db = Db(old_db, backfill_budget=None)
+    assert "streaks" in db.pending_backfills()
+
+    # carol has three goal days in the history the backfill has not reached yet,
+    # so no streak is reported rather than a false record.
+    day4 = datetime(2024, 1, 4).timestamp()
+    result = db.record_session("carol", "offline", day4, day4 + 3 * 3600, 3 * 3600)
+    assert (result['is_streak_record'], result['streak']) == (False, None)
+
+    db.run_backfills()
+    assert db.get_streak("carol", today=date(2024, 1, 4)) == {
+        'current': 4, 'longest': 4, 'goal': DEFAULT_STREAK_GOAL, 'today': 3 * 3600
+    }
+    result = db.record_session("carol", "offline", day4 + 4 * 3600, day4 + 5 * 3600, 3600)
+    assert (result['is_streak_record'], result['streak']) == (False, 4)
+
+
+def test_streak_backfill_splits_one_user_across_chunks(tmp_path: Path, small_chunks: None) -> None:
+    db_path = tmp_path / "old.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(migrations.MIGRATIONS[0][2][0])
+        for day in range(1, 8):
+            start = datetime(2024, 1, day).timestamp()
+            conn.execute('''
+                INSERT INTO sessions (username, start_time, end_time, duration, type)
+                VALUES ('alice', ?, ?, 3600, 'offline'), ('alice', ?, ?, 3600, 'offline')
+            ''', (start, start + 3600, start + 7200, start + 10800))
+
+    db = Db(db_path, backfill_budget=None)
+    steps = 0
+    while not db.run_backfills(time_budget=0):
+        steps += 1
+        # Mid-replay the user is still left to the backfill.
+        with sqlite3.connect(db_path) as conn:
+            assert db._streak_backfill_pending(conn.cursor(), "alice")
+    assert steps >= 7
+
+    replayed = db.get_streak("alice", today=date(2024, 1, 7))
+    db.rebuild_streaks()
+    assert replayed == db.get_streak("alice", today=date(2024, 1, 7))
+    assert replayed['longest'] == 7
+
+
+def test_leaderboard_during_backfill(old_db: Path, small_chunks: None) -> None:
+    db = Db(old_db, backfill_budget=0)
+    assert db.pending_backfills() == ["user_totals", "streaks"]
+
+    totals = {e['username']: e['value'] for e in db.get_leaderboard()}
+    assert totals == {"alice": 9 * 3600, "bob": 9 * 3600, "carol": 9 * 3600}
+    assert db.get_leaderboard(metric='longest')[0]['value'] == 3 * 3600
+    with pytest.raises(RuntimeError):
+        db.get_leaderboard(metric='streak')
+
+    db.save_session("carol", "offline", 0, 1, 1)
+    assert db.get_leaderboard()[0] == {'rank': 1, 'username': "carol", 'value': 9 * 3600 + 1}
+
+
+def test_budget_none_skips_backfills(old_db: Path) -> None:
+    db = Db(old_db, backfill_budget=None)
+    assert db.pending_backfills() == ["user_totals", "streaks"]
+    with sqlite3.connect(old_db) as conn:
+        assert conn.execute('SELECT MAX(last_id) FROM backfills').fetchone()[0] == 0
+
+
+def test_should_stop_ends_backfill_after_chunk(old_db: Path, small_chunks: None) -> None:
+    db = Db(old_db, backfill_budget=None)
+    assert db.run_backfills(should_stop=lambda: True) is False
+    with sqlite3.connect(old_db) as conn:
+        assert conn.execute("SELECT last_id FROM backfills WHERE name = 'user_totals'").fetchone()[0] == 2
+
+
+def test_newer_schema_is_rejected(tmp_path: Path) -> None:
+    db_path = tmp_path / "future.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+
+    with pytest.raises(RuntimeError):
+        Db(db_path)
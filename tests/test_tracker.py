@@ -3,6 +3,7 @@ from __future__ import annotations
 import json
 import pytest
 import time
+from collections.abc import Callable
 from pathlib import Path
 from pytest_mock import MockerFixture
 from go_touch_grass.tracker import TimeTracker
@@ -82,3 +83,39 @@ def test_network_wait(mocker: MockerFixture) -> None:
 
     assert tracker.wait_for_network(timeout=10) is True
     assert mock_get.call_count == 3
+
+
+def test_new_longest_streak_message(tracker: TimeTracker, mocker: MockerFixture) -> None:
+    mock_output = mocker.MagicMock()
+    tracker.add_output_handler(mock_output)
+    mocker.patch.object(tracker.db, 'record_session', return_value={
+        'is_record': False, 'streak': 3, 'is_streak_record': True
+    })
+    tracker.state['last_shutdown'] = time.time() - 3 * 3600
+
+    tracker.report_offline_time()
+
+    messages = [call.args[0] for call in mock_output.send.call_args_list]
+    assert messages[1] == "test_user reached a new longest streak: 3 days!"
+
+
+def test_shutdown_signal_deferred_during_backfill(tracker: TimeTracker, mocker: MockerFixture) -> None:
+    mocker.patch.object(tracker.db, 'pending_backfills', return_value=["streaks"])
+    mock_sleep = mocker.patch('go_touch_grass.tracker.time.sleep')
+    mocker.patch.object(tracker, 'wait_for_network', return_value=True)
+    mocker.patch.object(tracker, 'report_offline_time')
+    on_shutdown = mocker.patch.object(tracker, 'on_shutdown')
+
+    def run_backfills(time_budget: float, should_stop: Callable[[], bool]) -> bool:
+        tracker.handle_shutdown(15)
+        # The session is not saved while the backfill holds the write lock.
+        assert on_shutdown.call_count == 0
+        assert should_stop() is True
+        return False
+
+    mocker.patch.object(tracker.db, 'run_backfills', side_effect=run_backfills)
+
+    with pytest.raises(SystemExit):
+        tracker.run()
+    assert on_shutdown.call_count == 1
+    mock_sleep.assert_not_called()